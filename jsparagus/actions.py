@@ -1,21 +1,109 @@
+import functools
+import operator
+import weakref
+
 from .ordered import OrderedFrozenSet
 from .grammar import InitNt, Nt
 from . import types
 
 
+@functools.lru_cache(maxsize=None)
+def _nt_alias(nt):
+    "Alias name under which reducing the given non-terminal is recorded."
+    name = nt.name
+    if isinstance(name, InitNt):
+        name = "Start_" + name.goal.name
+    return "nt_" + name
+
+
+@functools.lru_cache(maxsize=None)
+def _flag_alias(flag):
+    "Alias name under which reading or writing the given flag is recorded."
+    return "flag_" + flag
+
+
+# Table of all live Action instances, keyed by class and construction
+# arguments. Structurally identical actions are built over and over while
+# merging parser states; interning them lets equal actions share a single
+# object.
+_all_actions: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+
 class Action:
     __slots__ = [
-        "read",    # Set of trait names which are consumed by this action.
-        "write",   # Set of trait names which are mutated by this action.
-        "_hash",   # Cached hash.
+        "read",       # Set of trait names which are consumed by this action.
+        "write",      # Set of trait names which are mutated by this action.
+        "_read_key",  # Sorted tuple of read aliases, for hashing and equality.
+        "_write_key",  # Sorted tuple of write aliases, for hashing and equality.
+        "_hash",      # Cached hash.
+        "_sort_key",  # Cached deterministic ordering key.
+        "_is_condition",   # Whether this action is a condition.
+        "_update_stack",   # Whether this action changes the parser stack.
+        "__weakref__",
     ]
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Precompute the subclass-specific slot names and a getter fetching
+        # their values, so __eq__ and _finalize do not re-walk __slots__ and
+        # resolve attributes by name on every call. attrgetter returns the
+        # bare value for single-slot classes and a tuple otherwise; both
+        # sides of a comparison use the same getter, so this is consistent.
+        cls._cmp_slots = tuple(cls.__slots__)
+        cls._cmp_getter = operator.attrgetter(*cls._cmp_slots)
+
+    def __new__(cls, *args, **kwargs):
+        # Intern actions, such that constructing the same action twice
+        # returns the same object. __init__ still runs on the interned
+        # instance, but it only re-assigns the same field values.
+        key = cls, cls._key(*args, **kwargs)
+        try:
+            return _all_actions[key]
+        except KeyError:
+            obj = super().__new__(cls)
+            _all_actions[key] = obj
+            return obj
+
+    @classmethod
+    def _key(cls, read, write):
+        "Hashable identity of the constructor arguments, used for interning."
+        return tuple(read), tuple(write)
+
+    def __reduce__(self):
+        # Pickle actions through their constructor, as types.Type does: the
+        # interning __new__ takes the construction arguments, so the default
+        # slots-based protocol would call it without any. Reconstructing also
+        # re-interns the action and recomputes the cached hash, which is
+        # salt-randomized and would be stale in another process.
+        return self.__class__, self.__getnewargs__()
+
     def __init__(self, read, write):
-        assert isinstance(read, list)
-        assert isinstance(write, list)
+        if getattr(self, "_hash", None) is not None:
+            # Interned instance returned by __new__; it is already fully
+            # initialized and hashed.
+            return
+        if not isinstance(read, OrderedFrozenSet):
+            read = OrderedFrozenSet(read)
+        if not isinstance(write, OrderedFrozenSet):
+            write = OrderedFrozenSet(write)
         self.read = read
         self.write = write
+        self._read_key = tuple(sorted(read))
+        self._write_key = tuple(sorted(write))
         self._hash = None
+        self._sort_key = None
+        self._is_condition = False
+        self._update_stack = False
+
+    def _finalize(self):
+        """Compute the hash eagerly. Called at the end of each subclass
+        __init__, once all slots are assigned."""
+        if self._hash is not None:
+            return
+        # Slot values are hashed directly; they are all hashable, and repr-ing
+        # them would allocate a fresh string per slot for nothing.
+        self._hash = hash((self.__class__, self._read_key, self._write_key,
+                           self._cmp_getter(self)))
 
     def is_inconsistent(self):
         """Returns True whether this action is inconsistent. An action can be
@@ -26,7 +114,7 @@ class Action:
 
     def is_condition(self):
         "Unordered condition, which accept or not to reach the next state."
-        return False
+        return self._is_condition
 
     def condition(self):
         "Return the conditional action."
@@ -35,7 +123,7 @@ class Action:
     def update_stack(self):
         """Change the parser stack, and resume at a different location. If this function
         is defined, then the function reduce_with should be implemented."""
-        return False
+        return self._update_stack
 
     def reduce_with(self):
         "Returns the non-terminal with which this action is reducing with."
@@ -51,51 +139,51 @@ class Action:
         a single state instead of multiple states which are following each others."""
         actions = []
         if isinstance(self, Seq):
-            actions.extend(list(self.actions))
+            actions.extend(self.actions)
         else:
             actions.append(self)
         if isinstance(other, Seq):
-            actions.extend(list(other.actions))
+            actions.extend(other.actions)
         else:
             actions.append(other)
-        if any([a.is_condition() for a in actions]):
-            return None
-        if any([a.update_stack() for a in actions[:-1]]):
-            return None
+        # Check feasibility before allocating the Seq, so that rejected
+        # merges, which dominate during the state graph build, do not pay
+        # for an action which is immediately discarded.
+        last = len(actions) - 1
+        for i, a in enumerate(actions):
+            if a._is_condition:
+                return None
+            if i < last and a._update_stack:
+                return None
         return Seq(actions)
 
     def __eq__(self, other):
-        if self.__class__ != other.__class__:
+        if self is other:
+            return True
+        if type(self) is not type(other):
             return False
-        if sorted(self.read) != sorted(other.read):
+        if self.read != other.read:
             return False
-        if sorted(self.write) != sorted(other.write):
+        if self.write != other.write:
             return False
-        for s in self.__slots__:
-            if getattr(self, s) != getattr(other, s):
-                return False
-        return True
+        return self._cmp_getter(self) == other._cmp_getter(other)
 
     def __hash__(self):
-        if self._hash is not None:
-            return self._hash
-
-        def hashed_content():
-            yield self.__class__
-            yield "rd"
-            for alias in self.read:
-                yield alias
-            yield "wd"
-            for alias in self.write:
-                yield alias
-            for s in self.__slots__:
-                yield repr(getattr(self, s))
-
-        self._hash = hash(tuple(hashed_content()))
         return self._hash
 
+    def _ordering_key(self):
+        """Deterministic lexicographic ordering key. Slot values are compared
+        through their repr, as they are not ordered themselves."""
+        if self._sort_key is None:
+            self._sort_key = (self.__class__.__name__, self._read_key, self._write_key) \
+                + tuple(repr(getattr(self, s)) for s in self._cmp_slots)
+        return self._sort_key
+
     def __lt__(self, other):
-        return hash(self) < hash(other)
+        # Order actions by a deterministic key rather than by hash, which is
+        # salt-randomized per process and would make any sorted(actions)
+        # downstream non-reproducible.
+        return self._ordering_key() < other._ordering_key()
 
     def __repr__(self):
         return str(self)
@@ -108,26 +196,54 @@ class Reduce(Action):
     using the parser table after reducing this operation. """
     __slots__ = 'nt', 'replay', 'pop'
 
+    @classmethod
+    def _key(cls, nt, pop, replay=0):
+        return nt, pop, replay
+
+    def __getnewargs__(self):
+        return self.nt, self.pop, self.replay
+
     def __init__(self, nt, pop, replay=0):
-        name = nt.name
-        if isinstance(name, InitNt):
-            name = "Start_" + name.goal.name
-        super().__init__([], ["nt_" + name])
+        super().__init__([], [_nt_alias(nt)])
         self.nt = nt    # Non-terminal which is reduced
         self.pop = pop  # Number of stack elements which should be replayed.
         self.replay = replay  # List of terms to shift back
+        self._update_stack = True
+        self._finalize()
 
     def __str__(self):
         return "Reduce({}, {}, {})".format(self.nt, self.pop, self.replay)
 
-    def update_stack(self):
-        return True
-
     def reduce_with(self):
         return self
 
+    def _copy_with_replay(self, replay):
+        """Clone this action with a different replay count. Only the replay
+        slot differs, so the alias sets and their cached keys are shared
+        instead of being rebuilt by __init__. The copy is interned under the
+        same key a regular construction would use."""
+        key = Reduce, (self.nt, self.pop, replay)
+        try:
+            return _all_actions[key]
+        except KeyError:
+            obj = object.__new__(Reduce)
+            obj.read = self.read
+            obj.write = self.write
+            obj._read_key = self._read_key
+            obj._write_key = self._write_key
+            obj._hash = None
+            obj._sort_key = None
+            obj._is_condition = False
+            obj._update_stack = True
+            obj.nt = self.nt
+            obj.pop = self.pop
+            obj.replay = replay
+            obj._finalize()
+            _all_actions[key] = obj
+            return obj
+
     def shifted_action(self, shifted_term):
-        return Reduce(self.nt, self.pop, replay=self.replay + 1)
+        return self._copy_with_replay(self.replay + 1)
 
 
 class Lookahead(Action):
@@ -135,6 +251,13 @@ class Lookahead(Action):
     sequences of terminal/non-terminals sequences."""
     __slots__ = 'terms', 'accept'
 
+    @classmethod
+    def _key(cls, terms, accept):
+        return terms, accept
+
+    def __getnewargs__(self):
+        return self.terms, self.accept
+
     def __init__(self, terms, accept):
         assert isinstance(terms, (OrderedFrozenSet, frozenset))
         assert all(not isinstance(t, Nt) for t in terms)
@@ -142,15 +265,14 @@ class Lookahead(Action):
         super().__init__([], [])
         self.terms = terms
         self.accept = accept
+        self._is_condition = True
+        self._finalize()
 
     def is_inconsistent(self):
         # A lookahead restriction cannot be encoded in code, it has to be
         # solved using fix_with_lookahead.
         return True
 
-    def is_condition(self):
-        return True
-
     def condition(self):
         return self
 
@@ -171,10 +293,19 @@ class CheckNotOnNewLine(Action):
     shifted."""
     __slots__ = 'offset',
 
+    @classmethod
+    def _key(cls, offset=0):
+        return offset,
+
+    def __getnewargs__(self):
+        return self.offset,
+
     def __init__(self, offset=0):
         # assert offset >= -1 and "Smaller offsets are not supported on all backends."
         super().__init__([], [])
         self.offset = offset
+        self._is_condition = True
+        self._finalize()
 
     def is_inconsistent(self):
         # We can only look at stacked terminals. Having an offset of 0 implies
@@ -183,9 +314,6 @@ class CheckNotOnNewLine(Action):
         # on the stack.
         return self.offset >= 0
 
-    def is_condition(self):
-        return True
-
     def condition(self):
         return self
 
@@ -203,13 +331,19 @@ class FilterFlag(Action):
     next state if the top of the flag stack matches the expected value."""
     __slots__ = 'flag', 'value'
 
+    @classmethod
+    def _key(cls, flag, value):
+        return flag, value
+
+    def __getnewargs__(self):
+        return self.flag, self.value
+
     def __init__(self, flag, value):
-        super().__init__(["flag_" + flag], [])
+        super().__init__([_flag_alias(flag)], [])
         self.flag = flag
         self.value = value
-
-    def is_condition(self):
-        return True
+        self._is_condition = True
+        self._finalize()
 
     def condition(self):
         return self
@@ -226,10 +360,18 @@ class PushFlag(Action):
     LR(0) to an LR(k) without needing as much state duplications."""
     __slots__ = 'flag', 'value'
 
+    @classmethod
+    def _key(cls, flag, value):
+        return flag, value
+
+    def __getnewargs__(self):
+        return self.flag, self.value
+
     def __init__(self, flag, value):
-        super().__init__([], ["flag_" + flag])
+        super().__init__([], [_flag_alias(flag)])
         self.flag = flag
         self.value = value
+        self._finalize()
 
     def __str__(self):
         return "PushFlag({}, {})".format(self.flag, self.value)
@@ -239,9 +381,18 @@ class PopFlag(Action):
     """Define an action which pops a flag from the flag bit stack."""
     __slots__ = 'flag',
 
+    @classmethod
+    def _key(cls, flag):
+        return flag,
+
+    def __getnewargs__(self):
+        return self.flag,
+
     def __init__(self, flag):
-        super().__init__(["flag_" + flag], ["flag_" + flag])
+        alias = _flag_alias(flag)
+        super().__init__([alias], [alias])
         self.flag = flag
+        self._finalize()
 
     def __str__(self):
         return "PopFlag({})".format(self.flag)
@@ -254,6 +405,27 @@ class FunCall(Action):
     again using the parser table after reducing this operation. """
     __slots__ = 'trait', 'method', 'offset', 'args', 'fallible', 'set_to'
 
+    @classmethod
+    def _key(cls, method, args,
+             trait=types.Type("AstBuilder"),
+             fallible=False,
+             set_to="val",
+             offset=0,
+             alias_read=[],
+             alias_write=[]):
+        # As with Seq, the alias sets are iterated both here and in
+        # __init__, so one-shot iterables are not acceptable.
+        assert isinstance(alias_read, (list, tuple, OrderedFrozenSet))
+        assert isinstance(alias_write, (list, tuple, OrderedFrozenSet))
+        return (method, args, trait, fallible, set_to, offset,
+                tuple(alias_read), tuple(alias_write))
+
+    def __getnewargs__(self):
+        # The alias sets are passed as tuples; __init__ rebuilds fresh
+        # OrderedFrozenSets rather than restoring ones with a cached hash.
+        return (self.method, self.args, self.trait, self.fallible,
+                self.set_to, self.offset, tuple(self.read), tuple(self.write))
+
     def __init__(self, method, args,
                  trait=types.Type("AstBuilder"),
                  fallible=False,
@@ -268,6 +440,7 @@ class FunCall(Action):
         self.offset = offset      # Offset to add to each argument offset.
         self.args = args          # Tuple of arguments offsets.
         self.set_to = set_to      # Temporary variable name to set with the result.
+        self._finalize()
 
     def __str__(self):
         return "{} = {}::{}({}){} [off: {}]".format(
@@ -298,14 +471,40 @@ class Seq(Action):
     state. Only the last action aggregated can update the parser stack"""
     __slots__ = 'actions',
 
+    @classmethod
+    def _key(cls, actions):
+        # A one-shot iterable would be exhausted here, in __new__, leaving
+        # nothing for __init__ to consume; require a re-iterable sequence.
+        assert isinstance(actions, (list, tuple))
+        return tuple(actions),
+
+    def __getnewargs__(self):
+        return self.actions,
+
     def __init__(self, actions):
-        assert isinstance(actions, list)
-        read = [rd for a in actions for rd in a.read]
-        write = [wr for a in actions for wr in a.write]
+        actions = tuple(actions)
+        read = []
+        write = []
+        for a in actions:
+            read.extend(a.read)
+            write.extend(a.write)
         super().__init__(read, write)
-        self.actions = tuple(actions)   # Ordered list of actions to execute.
-        assert all([not a.is_condition() for a in actions[1:]])
-        assert all([not a.update_stack() for a in actions[:-1]])
+        self.actions = actions   # Ordered list of actions to execute.
+        if actions:
+            self._is_condition = actions[0]._is_condition
+            self._update_stack = actions[-1]._update_stack
+        if __debug__:
+            self._validate()
+        self._finalize()
+
+    def _validate(self):
+        # Only the first action can be a condition, and only the last one can
+        # update the parser stack. maybe_add guarantees this for the sequences
+        # it builds; this check catches other callers.
+        last = len(self.actions) - 1
+        for i, a in enumerate(self.actions):
+            assert i == 0 or not a._is_condition
+            assert i == last or not a._update_stack
 
     def __str__(self):
         return "{{ {} }}".format("; ".join(map(str, self.actions)))
@@ -313,18 +512,11 @@ class Seq(Action):
     def __repr__(self):
         return "Seq({})".format(repr(self.actions))
 
-    def is_condition(self):
-        return self.actions[0].is_condition()
-
     def condition(self):
         return self.actions[0]
 
-    def update_stack(self):
-        return self.actions[-1].update_stack()
-
     def reduce_with(self):
         return self.actions[-1].reduce_with()
 
-    def shifted_action(self, shift):
-        actions = list(map(lambda a: a.shifted_action(shift), self.actions))
-        return Seq(actions)
+    def shifted_action(self, shifted_term):
+        return Seq([a.shifted_action(shifted_term) for a in self.actions])
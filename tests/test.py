@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
 import io
+import os
+import pickle
 import re
+import tempfile
 import unittest
 import jsparagus
-from jsparagus import gen, lexer
+from jsparagus import actions, gen, lexer
 from jsparagus.grammar import (Grammar, Production, CallMethod, Nt,
-                               Optional, LookaheadRule, NtDef, Var)
+                               Optional, LookaheadRule, NtDef, Var,
+                               example_grammar)
 
 
 LispTokenizer = lexer.LexicalGrammar("( )", SYMBOL=r'[!%&*+:<=>?@A-Z^_a-z~]+')
@@ -1120,5 +1124,43 @@ class GenTestCase(unittest.TestCase):
         self.assertParse("{}", ('goal', '{', ('xlist_0',), '}'))
 
 
+class ActionTestCase(unittest.TestCase):
+    def testFlagStoredAsString(self):
+        # The flag slot holds the flag name itself, not a 1-tuple of it, so
+        # comparing it against a plain string works.
+        for cls in [actions.FilterFlag, actions.PushFlag]:
+            a = cls("in", True)
+            self.assertEqual(a.flag, "in")
+            self.assertEqual(a, cls("in", True))
+            self.assertEqual(hash(a), hash(cls("in", True)))
+            self.assertNotEqual(a, cls("yield", True))
+
+    def testPickleRoundTrip(self):
+        # Unpickling reconstructs actions through their constructors, so
+        # they pass through the interning __new__ and come back equal, with
+        # a hash recomputed for this process.
+        red = actions.Reduce(Nt("expr"), 2)
+        call = actions.FunCall("method", (0, 1),
+                               alias_read=["a"], alias_write=["b"])
+        for a in [red, call, actions.FilterFlag("in", True),
+                  actions.Seq([call, red])]:
+            b = pickle.loads(pickle.dumps(a))
+            self.assertEqual(a, b)
+            self.assertEqual(hash(a), hash(b))
+
+
+class ParseTableTestCase(unittest.TestCase):
+    def testSaveLoadRoundTrip(self):
+        # save/load pickles every state, including the actions held by
+        # epsilon edges.
+        parse_table = gen.generate_parser_states(example_grammar())
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "parse_table.pkl")
+            parse_table.save(filename)
+            loaded = gen.ParseTable.load(filename)
+        self.assertEqual(len(loaded.states), len(parse_table.states))
+        self.assertEqual(loaded.named_goals, parse_table.named_goals)
+
+
 if __name__ == '__main__':
     unittest.main()